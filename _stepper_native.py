@@ -0,0 +1,50 @@
+"""
+Step loops for stepper.py compiled with the native emitter.
+
+Firmware built without the native emitter cannot compile this module, so stepper.py imports it inside try/except
+and keeps its own bytecode versions of the same loops when the import fails.
+"""
+import micropython
+from math import sqrt
+
+@micropython.native
+def pulse_loop(setpin, n, delay, sleep, wait, pulse_us):
+    """
+    Emits n step pulses of pulse_us through setpin, waiting delay microseconds after each one.
+    """
+    for _ in range(n):
+        setpin(0)
+        sleep(pulse_us)
+        setpin(1)
+        wait(delay)
+
+@micropython.native
+def ramp_loop(setpin, n, table, ramp_steps, c0, delay, sleep, wait, pulse_us):
+    """
+    Emits n step pulses along the acceleration ramp, mirrored at the end of the move. The first ramp delays come
+    from the table, the rest of the ramp_steps are computed from c0 and delay is used once the ramp is over.
+    """
+    ramp = len(table)
+    for i in range(n):
+        k = min(i, n - 1 - i)
+        if k < ramp: d = table[k]
+        elif k < ramp_steps: d = max(int(c0 * (sqrt(k + 1) - sqrt(k))), delay)
+        else: d = delay
+        setpin(0)
+        sleep(pulse_us)
+        setpin(1)
+        wait(d)
+
+@micropython.native
+def tick_loop(moves, n, delay, sleep, wait, pulse_us):
+    """
+    Emits n ticks, each one pulsing every (setpin, steps) of moves that still has steps left and then waiting
+    delay microseconds once for all of them.
+    """
+    for i in range(n):
+        for setpin, steps in moves:
+            if steps > i: setpin(0)
+        sleep(pulse_us)
+        for setpin, steps in moves:
+            if steps > i: setpin(1)
+        wait(delay)
@@ -0,0 +1,42 @@
+"""
+RP2040 fast paths for stepper.py, driving GPIOs through the SIO registers from viper code.
+
+Viper needs the native emitter, so stepper.py imports this module only on rp2 and falls back to Pin.value() when it
+cannot be imported or compiled.
+"""
+import micropython
+from micropython import const
+from utime import sleep_us
+
+_SIO_GPIO_OUT_SET = const(0xd0000014)
+_SIO_GPIO_OUT_CLR = const(0xd0000018)
+_SIO_GPIO_OUT_XOR = const(0xd000001c)
+
+@micropython.viper
+def pulse_train(mask: int, n: int, delay_us: int, pulse_us: int, wait):
+    """
+    Emits n step pulses of pulse_us on the GPIOs in mask by writing the SIO set/clear registers directly,
+    waiting delay_us microseconds after each one through wait.
+    """
+    gpio_set = ptr32(_SIO_GPIO_OUT_SET)
+    gpio_clr = ptr32(_SIO_GPIO_OUT_CLR)
+    for _ in range(n):
+        gpio_clr[0] = mask
+        sleep_us(pulse_us)
+        gpio_set[0] = mask
+        wait(delay_us)
+
+@micropython.viper
+def write_pins(set_mask: int, clr_mask: int):
+    """
+    Drives several GPIOs at once through the SIO set/clear registers.
+    """
+    ptr32(_SIO_GPIO_OUT_SET)[0] = set_mask
+    ptr32(_SIO_GPIO_OUT_CLR)[0] = clr_mask
+
+@micropython.viper
+def toggle(mask: int):
+    """
+    Flips the GPIOs in mask with a single SIO XOR register write.
+    """
+    ptr32(_SIO_GPIO_OUT_XOR)[0] = mask
@@ -0,0 +1,17 @@
+# Freezes the drivers into the firmware image, build with:
+#   make BOARD=<board> FROZEN_MANIFEST=/path/to/manifest.py
+# FROZEN_MANIFEST replaces the board's own manifest, so it is included first to keep the modules the firmware
+# relies on (asyncio, rp2's asm_pio, _boot.py). Boards with their own manifest.py should include that one instead.
+# opt=3 compiles with mpy-cross -O3, stripping asserts and line numbers.
+#
+# Without rebuilding the firmware, copy precompiled modules to the board instead. -march must match the port
+# for the native and viper functions in _stepper_native.py and _stepper_rp2.py (armv6m for rp2, xtensawin
+# for esp32):
+#   mpy-cross -O3 -march=armv6m _stepper_native.py _stepper_rp2.py
+
+include("$(PORT_DIR)/boards/manifest.py")
+
+module("servos.py", opt=3)
+module("stepper.py", opt=3)
+module("_stepper_native.py", opt=3)
+module("_stepper_rp2.py", opt=3)
@@ -1,6 +1,9 @@
 from machine import Pin, PWM
-from math import radians, degrees
-from time import sleep
+from math import degrees
+from micropython import const
+from utime import sleep
+
+_NS_PER_US = const(1000)
 
 class Servo:
     """
@@ -23,7 +26,7 @@ class Servo:
 
     - write(self, value: float, method: str = 'deg') -> None:
         Writes the specified value to the servo, where value is either in degrees ('deg'), radians ('rad'),
-        or microseconds ('us'). Raises a ValueError if the value is not a float or int.
+        or microseconds ('us'). Raises a ValueError if the value is not a float or int, or the method is unknown.
 
     - read(self, method: str = 'deg') -> int:
         Reads the current position of the servo in degrees ('deg'), radians ('rad'), or microseconds ('us').
@@ -35,16 +38,22 @@ class Servo:
         Turns off the servo by setting the PWM duty cycle to 0.
 
     Private Methods:
+    - __get_pwm(cls, pin: int, freq: int) -> PWM:
+        Returns the PWM object for the pin, creating it only the first time the pin is used.
+
+    - __write_ns(self, ns: float) -> None:
+        Writes the pulse duration in nanoseconds to the servo, ensuring it stays within the valid range.
+
     - __write_us(self, us: float) -> None:
-        Writes the pulse duration in microseconds to the servo, ensuring it stays within the valid range.
+        Converts the pulse duration in microseconds to nanoseconds and writes it to the servo.
 
     - __write_rad(self, rad: float) -> None:
-        Converts the angle in radians to microseconds and writes it to the servo.
+        Converts the angle in radians to nanoseconds and writes it to the servo.
 
     - __write_deg(self, deg: float) -> None:
-        Converts the angle in degrees to radians and writes it to the servo.
+        Converts the angle in degrees to nanoseconds and writes it to the servo.
 
-    - __read_us(self) -> int:
+    - __read_us(self) -> float:
         Returns the current pulse duration in microseconds.
 
     - __read_rad(self) -> int:
@@ -54,14 +63,30 @@ class Servo:
         Converts the current pulse duration to degrees and returns the angle.
     """
 
+    # PWM objects already created, keyed by pin number
+    __pwm_cache = {}
+
     def __init__(self, pin: int, min_us: float, max_us: float, min_deg: float, max_deg: float, freq:int) -> None:
-        self.__pwm = PWM(Pin(15, Pin.OUT), freq=freq)
-        self.__current_us: float = 0
+        self.__pwm = self.__get_pwm(pin, freq)
+        self.__current_ns: int = 0
         self.off()
-        self.__min_us = min_us
-        self.__max_us = max_us
-        self.__slope = (min_us-max_us)/(radians(min_deg)-radians(max_deg))
-        self.__offset = min_us
+        # the whole write path works in nanoseconds, the unit taken by PWM.duty_ns()
+        self.__min_ns = min_us*_NS_PER_US
+        self.__max_ns = max_us*_NS_PER_US
+        self.__slope_deg = (min_us-max_us)*_NS_PER_US/(min_deg-max_deg)
+        self.__slope_rad = degrees(self.__slope_deg)
+        self.__offset = min_us*_NS_PER_US
+        self.__writers = {'deg': self.__write_deg, 'rad': self.__write_rad, 'us': self.__write_us}
+        self.__readers = {'deg': self.__read_deg, 'rad': self.__read_rad, 'us': self.__read_us}
+
+    @classmethod
+    def __get_pwm(cls, pin: int, freq: int) -> PWM:
+        pwm = cls.__pwm_cache.get(pin)
+        if pwm is None:
+            pwm = cls.__pwm_cache[pin] = PWM(Pin(pin, Pin.OUT), freq=freq)
+        elif pwm.freq() != freq:
+            pwm.freq(freq)
+        return pwm
 
     def write(self, value: float, method: str= 'deg') -> None:
         """
@@ -70,32 +95,34 @@ class Servo:
         Args:
         - value (float): The value to be written to the servo.
         - method (str): The unit of the value ('deg', 'rad', or 'us'). Default is 'deg'.
+
+        Raises:
+        - ValueError: If the value is not a float or int, or the method is unknown.
         """
 
-        if not isinstance(value, (int, float)): 
-            raise ValueError(f"Value must be float or int, received {type(value)}")
+        try: writer = self.__writers[method]
+        except KeyError: raise ValueError(f"Method must be 'deg', 'rad' or 'us', received {method}")
 
-        if method == 'deg':
-            self.__write_deg(value)
-        elif method == 'rad':
-            self.__write_rad(value)
-        elif method == 'us':
-            self.__write_us(value)
+        try: writer(value)
+        except TypeError: raise ValueError(f"Value must be float or int, received {type(value)}")
 
-    def __write_us(self, us: float) -> None:
-        if us < self.__min_us:
-            us = self.__min_us
-        elif us > self.__max_us:
-            us = self.__max_us
+    def __write_ns(self, ns: float) -> None:
+        if ns < self.__min_ns:
+            ns = self.__min_ns
+        elif ns > self.__max_ns:
+            ns = self.__max_ns
+
+        self.__current_ns = int(ns)
+        self.__pwm.duty_ns(self.__current_ns)
 
-        self.__current_us = us
-        self.__pwm.duty_ns(int(self.__current_us*1000))
+    def __write_us(self, us: float) -> None:
+        self.__write_ns(us*_NS_PER_US)
 
     def __write_rad(self, rad: float) -> None:
-        self.__write_us(rad*self.__slope+self.__offset)
+        self.__write_ns(rad*self.__slope_rad+self.__offset)
 
     def __write_deg(self, deg: float) -> None:
-        self.__write_rad(radians(deg))
+        self.__write_ns(deg*self.__slope_deg+self.__offset)
 
     def read(self, method: str= 'deg') -> int or float:
         """
@@ -106,22 +133,22 @@ class Servo:
 
         Returns:
         - int or float: The current position of the servo in the specified unit.
+
+        Raises:
+        - ValueError: If the method is unknown.
         """
-        if method == 'deg':
-            return self.__read_deg()
-        elif method == 'rad':
-            return self.__read_rad()
-        elif method == 'us':
-            return self.__read_us()
+        try: reader = self.__readers[method]
+        except KeyError: raise ValueError(f"Method must be 'deg', 'rad' or 'us', received {method}")
+        return reader()
 
     def __read_deg(self) -> float:
-        return degrees(self.__read_rad())
+        return (self.__current_ns-self.__offset)/self.__slope_deg
 
     def __read_rad(self) -> float:
-        return (self.__current_us-self.__offset)/self.__slope
+        return (self.__current_ns-self.__offset)/self.__slope_rad
 
-    def __read_us(self) -> int:
-        return self.__current_us
+    def __read_us(self) -> float:
+        return self.__current_ns/_NS_PER_US
 
     def rotate(self, value: float, intervals: int= 0, time: int= 0, method: str= 'deg') -> None:
         """
@@ -1,57 +1,215 @@
-from machine import Pin
-from utime import sleep_ms, ticks_us, sleep_us
+from micropython import const
+from array import array
+from machine import Pin, Timer
+from math import sqrt
+from sys import platform
+from utime import sleep_ms, sleep_us, ticks_add, ticks_diff, ticks_us
 
-MICRO_TO_SECOND: int = 1e6
+_US_PER_MINUTE = const(60_000_000)
+_US_PER_SECOND = const(1_000_000)
+_US_PER_MS = const(1000)
+# width of the step pulse, the A4988 needs at least 1 us
+_PULSE_US = const(2)
+_STEPS = const(200)
+
+# RP2040 helpers driving GPIOs through the SIO registers instead of Pin.value(). They are viper code, so they live
+# in their own module and the Pin.value() paths are used when it cannot be compiled on this firmware.
+_RP2 = platform == 'rp2'
+_sio = None
+if _RP2:
+    try: import _stepper_rp2 as _sio
+    except (ImportError, SyntaxError, ValueError): pass
+
+# delays up to this long are spun on ticks_us, longer ones sleep first and spin the last _SPIN_MARGIN_US
+_SPIN_US = const(500)
+_SPIN_MARGIN_US = const(200)
+
+# entries kept in the acceleration table, 2 bytes each, the delays of longer ramps are computed while stepping
+_ACCEL_TABLE_MAX = const(256)
+# lowest non-zero acceleration, in steps/s^2, whose first delay c0 = 1e6 * sqrt(2 / accel) still fits the table
+_ACCEL_MIN = const(466)
+
+def _precise_delay(us):
+    """
+    Waits us microseconds, sleeping through long delays so the scheduler can run and spinning on ticks_us
+    for the remainder, since sleep_us over-sleeps short delays on ports where it yields.
+    """
+    deadline = ticks_add(ticks_us(), us)
+    if us > _SPIN_US: sleep_us(us - _SPIN_MARGIN_US)
+    while ticks_diff(deadline, ticks_us()) > 0: pass
+
+def _pulse_loop(setpin, n, delay, sleep, wait, pulse_us):
+    """
+    Emits n step pulses of pulse_us through setpin, waiting delay microseconds after each one.
+    """
+    for _ in range(n):
+        setpin(0)
+        sleep(pulse_us)
+        setpin(1)
+        wait(delay)
+
+def _ramp_loop(setpin, n, table, ramp_steps, c0, delay, sleep, wait, pulse_us):
+    """
+    Emits n step pulses along the acceleration ramp, mirrored at the end of the move. The first ramp delays come
+    from the table, the rest of the ramp_steps are computed from c0 and delay is used once the ramp is over.
+    """
+    ramp = len(table)
+    for i in range(n):
+        k = min(i, n - 1 - i)
+        if k < ramp: d = table[k]
+        elif k < ramp_steps: d = max(int(c0 * (sqrt(k + 1) - sqrt(k))), delay)
+        else: d = delay
+        setpin(0)
+        sleep(pulse_us)
+        setpin(1)
+        wait(d)
+
+def _tick_loop(moves, n, delay, sleep, wait, pulse_us):
+    """
+    Emits n ticks, each one pulsing every (setpin, steps) of moves that still has steps left and then waiting
+    delay microseconds once for all of them.
+    """
+    for i in range(n):
+        for setpin, steps in moves:
+            if steps > i: setpin(0)
+        sleep(pulse_us)
+        for setpin, steps in moves:
+            if steps > i: setpin(1)
+        wait(delay)
+
+# the same loops compiled with the native emitter, where the firmware has one; a frozen or precompiled module
+# built for another architecture fails with ValueError
+try: from _stepper_native import pulse_loop as _pulse_loop, ramp_loop as _ramp_loop, tick_loop as _tick_loop
+except (ImportError, SyntaxError, ValueError): pass
+
+if _RP2:
+    import rp2
+
+    # PIO clock used by the step program, one cycle per microsecond
+    _PIO_FREQ = const(1_000_000)
+    # cycles the program spends per pulse outside its two delay loops
+    _PIO_OVERHEAD = const(7)
+
+    @rp2.asm_pio(set_init=rp2.PIO.OUT_LOW)
+    def _step_program():
+        # TX FIFO: number of pulses - 1, then the half period in cycles
+        pull(block)
+        mov(x, osr)
+        pull(block)
+        label("pulse")
+        set(pins, 1)
+        mov(y, osr)
+        label("high")
+        jmp(y_dec, "high")
+        set(pins, 0)
+        mov(y, osr)
+        label("low")
+        jmp(y_dec, "low")
+        jmp(x_dec, "pulse")
+        # RX FIFO: one word per finished move
+        push(noblock)
+
+def _to_pin(pin):
+    """
+    Returns the pin connected to the stepper driver as a Pin instance.
+
+    Parameters:
+    - pin: Either an instance of the Pin class or an integer representing the GPIO pin number.
+
+    Raises:
+    - TypeError: If the pin value is not of type 'int' or 'Pin'.
+    """
+    if hasattr(pin, 'value'): return pin
+    try: return Pin(pin, Pin.OUT)
+    except TypeError: raise TypeError("pin value must be of type 'int' or 'Pin'")
 
 class DriverDefault:
 
-    STEPS = 200
+    STEPS = _STEPS
 
-    def __init__(self, step: int or Pin, direction: int or Pin, enable: int or Pin = None, microsteps: int = 1):
+    def __init__(
+            self, step: int or Pin, direction: int or Pin, enable: int or Pin = None, microsteps: int = 1,
+            sm: int = None, timer: int = None,
+                ):
 
-        self.__step_pin = self.__pin(step)
-        self.__dir_pin = self.__pin(direction)
-        if enable is not None: self.__enable_pin = self.__pin(enable)
+        self.__step_pin = _to_pin(step)
+        # SIO bit of the step pin, only known on rp2 when the pin is given as a GPIO number
+        self.__step_mask = 1 << step if _sio is not None and isinstance(step, int) else 0
+        self.__dir_pin = _to_pin(direction)
+        self.__enable_pin = _to_pin(enable) if enable is not None else None
 
         self.__microsteps = microsteps
         self.position = 0.0
         self.__rpm = 0.0
+        self.__delay = 0
+        self.__accel = 0
+        self.__accel_table = None
+        self.__accel_c0 = 0.0
+        self.__ramp_steps = 0
 
-    def __pin(self, pin):
-        """
-        Adds a pin to the list of pins connected to the stepper motor.
+        self.__sm = None
+        self.__pending = 0
+        if sm is not None:
+            if not _RP2: raise ValueError("PIO state machines are only available on rp2")
+            self.__sm = rp2.StateMachine(sm, _step_program, freq=_PIO_FREQ, set_base=self.__step_pin)
+            self.__sm.active(1)
 
-        Parameters:
-        - pin: Either an instance of the Pin class or an integer representing the GPIO pin number.
-        
-        Raises:
-        - TypeError: If the pin value is not of type 'int' or 'Pin'.
-        """
-        if isinstance(pin, Pin): return pin
-        elif isinstance(pin, int): return Pin(pin, Pin.OUT)
-        else: raise TypeError("pin value must be of type 'int' or 'Pin'")
+        # hardware timer fallback for non-blocking moves where PIO is not available
+        self.__timer = None
+        self.__edges = 0
+        if timer is not None:
+            if sm is not None: raise ValueError("use either a PIO state machine or a timer, not both")
+            self.__timer = Timer(timer)
+            self.__on_timer_cb = self.__on_timer
 
     def step(self):
-        delay = self.delay()
-        prev_time_us = ticks_us()
-        times = 2
-        self.__step_pin.value(0)
-        while True:
-            current_time_us = ticks_us()
-            if current_time_us - prev_time_us > delay:
-                self.__step_pin.value(1)
-                prev_time_us = ticks_us()
-                break
+        self._check_move()
+        # a timer move still toggling the pin would interleave its edges with this pulse
+        self.wait()
+        self._step_fast(self.__delay)
+
+    def _step_fast(self, delay, _sleep=sleep_us, _wait=_precise_delay):
+        mask = self.__step_mask
+        if mask:
+            _flip = _sio.toggle
+            # two flips give exactly one rising edge whatever level the pin idles at
+            _flip(mask)
+            _sleep(_PULSE_US)
+            _flip(mask)
+            _wait(delay)
+            return
+
+        _pulse_loop(self.__step_pin.value, 1, delay, _sleep, _wait, _PULSE_US)
 
     def microsteps(self, microsteps: int = None):
         if microsteps is None: return self.__microsteps
         self.__microsteps = microsteps
+        self._recompute_delay()
         return microsteps
 
     def rpm(self, rpm: float=None):
-        if rpm is not None: self.__rpm = rpm
+        if rpm is not None:
+            self.__rpm = rpm
+            self._recompute_delay()
         return self.__rpm
     
+    def acceleration(self, accel: float = None):
+        """
+        Gets or sets the acceleration, in steps/s^2, used by rotate() to ramp up to and down from the rpm speed.
+        An acceleration of 0 disables the ramp, otherwise it must be at least 466 steps/s^2 so the first step
+        delay fits the 16-bit ramp table. The ramp takes v^2 / (2 * accel) steps to reach the rpm speed, the
+        delays of the first 256 are cached and the rest are computed while stepping. Moves run by a PIO
+        state machine, a timer, rotate_async() or rotate_multi() skip the ramp and run at constant rpm speed.
+
+        Raises:
+        - ValueError: If accel is between 0 and 466 steps/s^2.
+        """
+        if accel is not None:
+            if 0 < accel < _ACCEL_MIN: raise ValueError("acceleration must be 0 or at least %d steps/s^2" % _ACCEL_MIN)
+            self.__accel = accel
+            self._recompute_delay()
+        return self.__accel
+
     def enable(self):
         if self.__enable_pin is None: return "Pin not configured"
         if self.__enable_pin.value(): self.__enable_pin.value(0)
@@ -65,41 +223,203 @@ class DriverDefault:
         self.__dir_pin.value(direction)
         return self.__dir_pin.value()
 
-    def delay(self, ):
-        return int(60*MICRO_TO_SECOND / (self.STEPS * self.__microsteps * self.__rpm))
+    def delay(self):
+        return self.__delay
+
+    def _recompute_delay(self):
+        """
+        Updates the cached step delay and acceleration ramp, must be called whenever rpm, microsteps or
+        acceleration change.
+        """
+        if self.__rpm > 0: self.__delay = int(_US_PER_MINUTE // (self.STEPS * self.__microsteps * self.__rpm))
+        else: self.__delay = 0
+
+        self.__accel_table = None
+        if self.__accel <= 0 or self.__delay <= 0: return
+
+        # delay of the i-th step from standstill at constant acceleration, c0 * (sqrt(i+1) - sqrt(i)),
+        # cruise speed v is reached after v^2 / (2 * accel) steps
+        c0 = _US_PER_SECOND * sqrt(2 / self.__accel)
+        speed = _US_PER_SECOND / self.__delay
+        ramp = int(speed * speed / (2 * self.__accel)) + 1
+        table = array('H')
+        for i in range(min(ramp, _ACCEL_TABLE_MAX)):
+            delay = int(c0 * (sqrt(i + 1) - sqrt(i)))
+            if delay <= self.__delay: break
+            table.append(delay)
+        self.__accel_c0 = c0
+        # a full table means the ramp may go on past it, otherwise it ends with the table
+        self.__ramp_steps = ramp if len(table) == _ACCEL_TABLE_MAX else len(table)
+        self.__accel_table = table
 
-    def rotate(self, steps):
+    def _check_move(self, cpu: bool = True):
+        """
+        Raises ValueError if a move cannot run, cpu being whether the CPU drives the step pin itself.
+        """
+        if self.__delay <= 0: raise ValueError("rpm must be set before moving the motor")
+        if cpu and self.__sm is not None:
+            raise ValueError("the step pin is driven by the PIO state machine, use rotate()")
+
+    def _begin(self, steps):
+        """
+        Accounts a move of steps in the current direction and returns the step pin's value method.
+        """
         orientation = 1 if self.direction() else -1
         self.position += (1 / self.__microsteps * steps * orientation)
-          
+        return self.__step_pin.value
+
+    def rotate(self, steps, _sleep=sleep_us, _wait=_precise_delay):
+        self._check_move(cpu=self.__sm is None)
+
+        if self.__sm is not None:
+            if steps <= 0: return
+            self._begin(steps)
+            self.is_busy()
+            self.__sm.put(steps - 1)
+            self.__sm.put(max(self.__delay - _PIO_OVERHEAD, 0) // 2)
+            self.__pending += 1
+            return
+
+        if self.__timer is not None:
+            if steps <= 0: return
+            self.wait()
+            # armed before init() so the first callback already counts down this move
+            self.__edges = 2 * steps
+            # float freq, an integer division would round delays over 1 s to the wrong rate or to 0 Hz
+            try: self.__timer.init(freq=2 * _US_PER_SECOND / self.__delay, mode=Timer.PERIODIC, callback=self.__on_timer_cb)
+            except BaseException:
+                self.__edges = 0
+                raise
+            self._begin(steps)
+            return
+
+        setpin = self._begin(steps)
+        delay = self.__delay
+
+        table = self.__accel_table
+        if table:
+            # the ramp is mirrored at the end of the move, so short moves never reach full speed
+            _ramp_loop(setpin, steps, table, self.__ramp_steps, self.__accel_c0, delay, _sleep, _wait, _PULSE_US)
+            return
+
+        if self.__step_mask:
+            _sio.pulse_train(self.__step_mask, steps, delay, _PULSE_US, _wait)
+            return
+
+        _pulse_loop(setpin, steps, delay, _sleep, _wait, _PULSE_US)
+
+    async def rotate_async(self, steps, direction: bool = None):
+        """
+        Rotates at constant rpm speed, without the acceleration ramp, yielding to the asyncio scheduler between
+        pulses so several motors can run at once: await asyncio.gather(m1.rotate_async(200), m2.rotate_async(400)).
+
+        Only the whole milliseconds of the step delay are given up to the scheduler, the rest is slept in place.
+        """
+        # imported here so that firmware built without asyncio can still use the blocking moves
+        try: import asyncio
+        except ImportError: import uasyncio as asyncio
+
+        self._check_move()
+        while self.is_busy(): await asyncio.sleep_ms(1)
+        if direction is not None: self.direction(direction)
+        setpin = self._begin(steps)
+
+        delay_ms, delay_us = divmod(self.__delay, _US_PER_MS)
         for _ in range(steps):
-            self.step()
+            setpin(0)
+            sleep_us(_PULSE_US)
+            setpin(1)
+            sleep_us(delay_us)
+            await asyncio.sleep_ms(delay_ms)
+
+    def __on_timer(self, timer):
+        # one call per edge, the pin ends high after the last rising edge
+        self.__edges -= 1
+        self.__step_pin.value(~self.__edges & 1)
+        if not self.__edges: timer.deinit()
+
+    def is_busy(self):
+        """
+        Returns True while a move queued on the PIO state machine or timer is still running.
+        """
+        if self.__timer is not None: return self.__edges > 0
+        if self.__sm is None: return False
+        while self.__sm.rx_fifo():
+            self.__sm.get()
+            self.__pending -= 1
+        return self.__pending > 0
+
+    def wait(self):
+        """
+        Blocks until every move queued on the PIO state machine or timer has finished.
+        """
+        if self.__timer is not None:
+            while self.__edges: sleep_ms(1)
+            return
+        if self.__sm is None: return
+        while self.__pending:
+            self.__sm.get()
+            self.__pending -= 1
+
+def rotate_multi(moves, _sleep=sleep_us, _wait=_precise_delay):
+    """
+    Rotates several drivers together, moves being (driver, steps) pairs. The sign of steps sets each driver's
+    direction, a count of 0 leaves that driver as it is.
+
+    The pulses of all motors are written back to back and share a single delay, the shortest of the drivers'
+    delays, so every motor steps at the rate of the fastest one and stops once its own steps are done.
+    The acceleration ramp is not applied.
+    """
+    moves = list(moves)
+    for driver, _ in moves: driver._check_move()
+    for driver, steps in moves:
+        driver.wait()
+        if steps: driver.direction(steps > 0)
+    if not moves: return
+    delay = min(driver.delay() for driver, _ in moves)
+    moves = [(driver._begin(abs(steps)), abs(steps)) for driver, steps in moves]
+    _tick_loop(moves, max(steps for _, steps in moves), delay, _sleep, _wait, _PULSE_US)
 
 class DriverA4988(DriverDefault):
 
-    MICROSTEPS = {
-        1:  [0, 0, 0],
-        2:  [1, 0, 0],
-        4:  [0, 1, 0],
-        8:  [1, 1, 0],
-        16: [1, 1, 1],
-    }
+    MICROSTEPS = (1, 2, 4, 8, 16)
+    # MS1, MS2, MS3 levels for each entry of MICROSTEPS, three bytes per mode
+    MICROSTEP_STATES = (
+        b'\x00\x00\x00'
+        b'\x01\x00\x00'
+        b'\x00\x01\x00'
+        b'\x01\x01\x00'
+        b'\x01\x01\x01'
+    )
 
     def __init__(
             self, step: int or Pin, direction: int or Pin, enable: int or Pin = None, ms1: int or Pin = None,
             ms2: int or Pin = None, ms3: int or Pin = None, sleep: int or Pin = None, reset: int or Pin = None,
+            sm: int = None, timer: int = None, microsteps: int = 1,
                 ):
 
-        super().__init__(step, direction, enable)
+        super().__init__(step, direction, enable, sm=sm, timer=timer)
 
         self.__enable_microstep = ms1 and ms2 and ms3
         if self.__enable_microstep:
-            self.__ms1_pin = self.__pin(ms1)
-            self.__ms2_pin = self.__pin(ms2)
-            self.__ms3_pin = self.__pin(ms3)
+            self.__ms1_pin = _to_pin(ms1)
+            self.__ms2_pin = _to_pin(ms2)
+            self.__ms3_pin = _to_pin(ms3)
+
+        # with raw GPIO numbers on rp2, each mode is applied as a single set/clear mask pair
+        self.__ms_masks = None
+        if _sio is not None and isinstance(ms1, int) and isinstance(ms2, int) and isinstance(ms3, int):
+            bits = (1 << ms1, 1 << ms2, 1 << ms3)
+            states = self.MICROSTEP_STATES
+            self.__ms_masks = tuple(
+                (sum(bits[i] for i in range(3) if states[b + i]), sum(bits[i] for i in range(3) if not states[b + i]))
+                for b in range(0, len(states), 3)
+            )
 
-        self.__sleep_pin = self.__pin(sleep) if sleep else None
-        self.__reset_pin = self.__pin(reset) if reset else None
+        self.__sleep_pin = _to_pin(sleep) if sleep else None
+        self.__reset_pin = _to_pin(reset) if reset else None
+
+        self.microsteps(microsteps)
     
     def sleep(self):
         if self.__sleep_pin is None: return "Pin not configured"
@@ -118,33 +438,30 @@ class DriverA4988(DriverDefault):
         self.position = 0
 
     def microsteps(self, microsteps: int = None):
-        if self.__enable_microstep and (microsteps is None or microsteps not in self.MICROSTEPS.keys()): return self.__microsteps
-        self.__microsteps = microsteps
+        if microsteps not in self.MICROSTEPS: return super().microsteps()
+        # MS1-MS3 hard-wired through jumpers, only the divisor used for the delay is stored
+        if not self.__enable_microstep: return super().microsteps(microsteps)
 
-        ms1, ms2, ms3 = self.MICROSTEPS[microsteps]
-        self.__ms1_pin.value(ms1)
-        self.__ms2_pin.value(ms2)
-        self.__ms3_pin.value(ms3)
-            
-        return self.__microsteps
+        idx = self.MICROSTEPS.index(microsteps)
+        if self.__ms_masks is not None:
+            _sio.write_pins(*self.__ms_masks[idx])
+        else:
+            states, b = self.MICROSTEP_STATES, idx * 3
+            self.__ms1_pin.value(states[b])
+            self.__ms2_pin.value(states[b + 1])
+            self.__ms3_pin.value(states[b + 2])
 
-    def rotate(self, steps):
-        orientation = 1 if self.direction() else -1
-        self.position += (1 / self.__microsteps * steps * orientation)
-        
-        for _ in range(steps):
-            self.step()
+        return super().microsteps(microsteps)
 
 class DriverTB6600(DriverDefault):
 
     MICROSTEPS = [2**x for x in range(6)]
 
-    def __init__(self, step: int or Pin, direction: int or Pin, enable: int or Pin = None):
-        super().__init__(step, direction, enable)
+    def __init__(self, step: int or Pin, direction: int or Pin, enable: int or Pin = None, sm: int = None, timer: int = None):
+        super().__init__(step, direction, enable, sm=sm, timer=timer)
 
     def microsteps(self, microsteps: int = None):
-        if microsteps is None or microsteps not in self.MICROSTEPS: return self.__microsteps
-        self.__microsteps = microsteps
-        return self.__microsteps
+        if microsteps not in self.MICROSTEPS: return super().microsteps()
+        return super().microsteps(microsteps)
 
     # TODO: FIX Enable/Disable, probably hardware related
\ No newline at end of file